@@ -9,6 +9,11 @@ def _utc_now_iso() -> str:
     return datetime.now(timezone.utc).isoformat(timespec="seconds")
 
 
+def _hour_bucket(iso: str) -> str:
+    """Truncate a stored created_at timestamp to its hourly rollup bucket."""
+    return iso[:13] + ":00:00+00:00"
+
+
 @dataclass
 class MessageRecord:
     id: int
@@ -135,6 +140,71 @@ def init_db(db_path: str) -> None:
                     "CREATE INDEX IF NOT EXISTS idx_sms_status_created_at ON sms_messages(status, created_at)",
                 ],
             ),
+            (
+                3,
+                [
+                    # v3: hourly stats rollups, maintained alongside sms_messages writes
+                    """
+                    CREATE TABLE IF NOT EXISTS sms_stats_hourly (
+                      bucket TEXT NOT NULL,
+                      dimension TEXT NOT NULL,
+                      value TEXT NOT NULL,
+                      count INTEGER NOT NULL DEFAULT 0,
+                      PRIMARY KEY (bucket, dimension, value)
+                    )
+                    """,
+                    # Backfill from existing rows (one-time full scan)
+                    """
+                    INSERT INTO sms_stats_hourly (bucket, dimension, value, count)
+                    SELECT substr(created_at, 1, 13) || ':00:00+00:00', 'event', 'incoming', COUNT(*)
+                      FROM sms_messages
+                     GROUP BY 1
+                    """,
+                    """
+                    INSERT INTO sms_stats_hourly (bucket, dimension, value, count)
+                    SELECT substr(created_at, 1, 13) || ':00:00+00:00', 'status', status, COUNT(*)
+                      FROM sms_messages
+                     GROUP BY 1, 3
+                    """,
+                    # Delivery outcome events; best effort from current status, bucketed by created_at
+                    """
+                    INSERT INTO sms_stats_hourly (bucket, dimension, value, count)
+                    SELECT substr(created_at, 1, 13) || ':00:00+00:00', 'event',
+                           CASE status WHEN 'sent' THEN 'telegram_sent' ELSE 'telegram_error' END, COUNT(*)
+                      FROM sms_messages
+                     WHERE status IN ('sent', 'telegram_error')
+                     GROUP BY 1, 3
+                    """,
+                    """
+                    INSERT INTO sms_stats_hourly (bucket, dimension, value, count)
+                    SELECT substr(created_at, 1, 13) || ':00:00+00:00', 'sender', from_number, COUNT(*)
+                      FROM sms_messages
+                     GROUP BY 1, 3
+                    """,
+                ],
+            ),
+            (
+                4,
+                [
+                    # v4: redelivery jobs + checkpoint (keyset cursor per status)
+                    """
+                    CREATE TABLE IF NOT EXISTS redelivery_jobs (
+                      job_id TEXT PRIMARY KEY,
+                      params TEXT NOT NULL,
+                      state TEXT NOT NULL DEFAULT 'pending',
+                      cursor_status TEXT,
+                      cursor_created_at TEXT,
+                      cursor_id INTEGER,
+                      attempted INTEGER NOT NULL DEFAULT 0,
+                      sent INTEGER NOT NULL DEFAULT 0,
+                      failed INTEGER NOT NULL DEFAULT 0,
+                      last_error TEXT,
+                      created_at TEXT NOT NULL,
+                      updated_at TEXT NOT NULL
+                    )
+                    """,
+                ],
+            ),
         ]
 
         if current == 0:
@@ -162,6 +232,20 @@ def init_db(db_path: str) -> None:
         conn.close()
 
 
+def _bump_stat(
+    conn: sqlite3.Connection, *, bucket: str, dimension: str, value: str, delta: int = 1
+) -> None:
+    """Adjust one rollup counter. Caller owns the transaction/commit."""
+    conn.execute(
+        """
+        INSERT INTO sms_stats_hourly (bucket, dimension, value, count)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (bucket, dimension, value) DO UPDATE SET count = count + excluded.count
+        """,
+        (bucket, dimension, value, delta),
+    )
+
+
 def try_insert_incoming(
     *,
     db_path: str,
@@ -173,10 +257,15 @@ def try_insert_incoming(
     request_id: Optional[str],
     status: str = "received",
 ) -> tuple[bool, int]:
-    """Returns (inserted, row_id). If duplicate fingerprint, inserted=False."""
+    """Returns (inserted, row_id). If duplicate fingerprint, inserted=False.
+
+    Stats rollups (sms_stats_hourly) are updated in the same transaction.
+    """
     conn = connect(db_path)
     try:
         cur = conn.cursor()
+        created_at = _utc_now_iso()
+        bucket = _hour_bucket(created_at)
         try:
             cur.execute(
                 """
@@ -191,24 +280,67 @@ def try_insert_incoming(
                     from_number,
                     body,
                     received_at,
-                    _utc_now_iso(),
+                    created_at,
                     auth_method,
                     request_id,
                     status,
                 ),
             )
+            row_id = int(cur.lastrowid)
+            _bump_stat(conn, bucket=bucket, dimension="event", value="incoming")
+            _bump_stat(conn, bucket=bucket, dimension="status", value=status)
+            _bump_stat(conn, bucket=bucket, dimension="sender", value=from_number)
             conn.commit()
-            return True, int(cur.lastrowid)
+            return True, row_id
         except sqlite3.IntegrityError:
             row = conn.execute(
                 "SELECT id FROM sms_messages WHERE fingerprint = ?",
                 (fingerprint,),
             ).fetchone()
+            _bump_stat(conn, bucket=bucket, dimension="event", value="duplicate")
+            conn.commit()
             return False, int(row["id"]) if row else -1
     finally:
         conn.close()
 
 
+def _apply_telegram_result(
+    conn: sqlite3.Connection,
+    *,
+    row_id: int,
+    telegram_message_id: Optional[int],
+    telegram_error: Optional[str],
+) -> None:
+    """Update one row + its rollups. Caller holds the write lock (BEGIN IMMEDIATE) and commits."""
+    status = "sent" if not telegram_error else "telegram_error"
+    prev = conn.execute(
+        "SELECT status, created_at FROM sms_messages WHERE id = ?",
+        (row_id,),
+    ).fetchone()
+    if not prev:
+        return
+    conn.execute(
+        """
+        UPDATE sms_messages
+           SET telegram_message_id = ?, telegram_error = ?, status = ?
+         WHERE id = ?
+        """,
+        (telegram_message_id, telegram_error, status, row_id),
+    )
+    # Append-only outcome event, bucketed by attempt time (survives later redelivery).
+    _bump_stat(
+        conn,
+        bucket=_hour_bucket(_utc_now_iso()),
+        dimension="event",
+        value="telegram_error" if telegram_error else "telegram_sent",
+    )
+    if prev["status"] != status:
+        # Status rollups track current status, bucketed by the row's created_at.
+        bucket = _hour_bucket(prev["created_at"])
+        _bump_stat(conn, bucket=bucket, dimension="status", value=prev["status"], delta=-1)
+        _bump_stat(conn, bucket=bucket, dimension="status", value=status)
+
+
 def mark_telegram_result(
     *,
     db_path: str,
@@ -216,22 +348,220 @@ def mark_telegram_result(
     telegram_message_id: Optional[int],
     telegram_error: Optional[str],
 ) -> None:
-    status = "sent" if not telegram_error else "telegram_error"
     conn = connect(db_path)
     try:
+        # Take the write lock before reading the old status, so concurrent writers
+        # (server + CLI) can't both apply the same status move to the rollups.
+        conn.execute("BEGIN IMMEDIATE")
+        _apply_telegram_result(
+            conn,
+            row_id=row_id,
+            telegram_message_id=telegram_message_id,
+            telegram_error=telegram_error,
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def select_redelivery_candidates(
+    *,
+    db_path: str,
+    status: str,
+    since: str,
+    until: str,
+    after_created_at: Optional[str],
+    after_id: Optional[int],
+    limit: int,
+) -> list[dict]:
+    """Page through rows with the given status and since <= created_at < until.
+
+    Keyset pagination on (created_at, id) so the scan is served by
+    idx_sms_status_created_at and resumes cheaply from a checkpoint.
+    """
+    conn = connect(db_path)
+    try:
+        rows = conn.execute(
+            """
+            SELECT id, from_number, body, received_at, created_at, status
+              FROM sms_messages INDEXED BY idx_sms_status_created_at
+             WHERE status = ?
+               AND created_at >= ? AND created_at < ?
+               AND (created_at, id) > (?, ?)
+             ORDER BY created_at, id
+             LIMIT ?
+            """,
+            (status, since, until, after_created_at or "", after_id or 0, limit),
+        ).fetchall()
+        return [dict(r) for r in rows]
+    finally:
+        conn.close()
+
+
+def get_redelivery_job(*, db_path: str, job_id: str):
+    conn = connect(db_path)
+    try:
+        row = conn.execute("SELECT * FROM redelivery_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+    finally:
+        conn.close()
+
+
+def create_redelivery_job(*, db_path: str, job_id: str, params: str) -> None:
+    """Create a job row if missing (params is a JSON string). Existing jobs are left untouched."""
+    now = _utc_now_iso()
+    conn = connect(db_path)
+    try:
+        conn.execute(
+            """
+            INSERT OR IGNORE INTO redelivery_jobs (job_id, params, created_at, updated_at)
+            VALUES (?, ?, ?, ?)
+            """,
+            (job_id, params, now, now),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def claim_redelivery_job(
+    *, db_path: str, job_id: str, stale_before: str, params: Optional[str] = None
+) -> bool:
+    """Atomically mark a job 'running' if no other job is running (across processes).
+
+    If params (JSON string) is given, the job row is created in the same transaction.
+    'running' jobs with updated_at < stale_before are presumed dead (killed process)
+    and marked 'failed' first, so they can be resumed. Returns False if another job
+    holds the claim or job_id is unknown/done.
+    """
+    now = _utc_now_iso()
+    conn = connect(db_path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(
+            """
+            UPDATE redelivery_jobs
+               SET state = 'failed', last_error = 'stale: no progress since ' || updated_at, updated_at = ?
+             WHERE state = 'running' AND updated_at < ?
+            """,
+            (now, stale_before),
+        )
+        if conn.execute("SELECT 1 FROM redelivery_jobs WHERE state = 'running' LIMIT 1").fetchone():
+            conn.commit()
+            return False
+        if params is not None:
+            conn.execute(
+                """
+                INSERT OR IGNORE INTO redelivery_jobs (job_id, params, created_at, updated_at)
+                VALUES (?, ?, ?, ?)
+                """,
+                (job_id, params, now, now),
+            )
+        cur = conn.execute(
+            """
+            UPDATE redelivery_jobs
+               SET state = 'running', updated_at = ?
+             WHERE job_id = ? AND state != 'done'
+            """,
+            (now, job_id),
+        )
+        conn.commit()
+        return cur.rowcount == 1
+    finally:
+        conn.close()
+
+
+def set_redelivery_job_state(
+    *, db_path: str, job_id: str, state: str, last_error: Optional[str] = None
+) -> None:
+    conn = connect(db_path)
+    try:
+        conn.execute(
+            """
+            UPDATE redelivery_jobs
+               SET state = ?, last_error = COALESCE(?, last_error), updated_at = ?
+             WHERE job_id = ?
+            """,
+            (state, last_error, _utc_now_iso(), job_id),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def apply_redelivery_batch(
+    *,
+    db_path: str,
+    job_id: str,
+    results: list[tuple[int, Optional[int], Optional[str]]],
+    cursor_status: str,
+    cursor_created_at: str,
+    cursor_id: int,
+) -> None:
+    """Write a batch of (row_id, telegram_message_id, telegram_error) results.
+
+    Row updates, rollups and the job checkpoint commit in one transaction, so a
+    crash never advances the cursor past rows whose results were not stored.
+    """
+    sent = sum(1 for _, _, err in results if not err)
+    failed = len(results) - sent
+    last_error = next((err for _, _, err in reversed(results) if err), None)
+    conn = connect(db_path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        for row_id, telegram_message_id, telegram_error in results:
+            _apply_telegram_result(
+                conn,
+                row_id=row_id,
+                telegram_message_id=telegram_message_id,
+                telegram_error=telegram_error,
+            )
         conn.execute(
             """
-            UPDATE sms_messages
-               SET telegram_message_id = ?, telegram_error = ?, status = ?
-             WHERE id = ?
+            UPDATE redelivery_jobs
+               SET cursor_status = ?, cursor_created_at = ?, cursor_id = ?,
+                   attempted = attempted + ?, sent = sent + ?, failed = failed + ?,
+                   last_error = COALESCE(?, last_error), updated_at = ?
+             WHERE job_id = ?
             """,
-            (telegram_message_id, telegram_error, status, row_id),
+            (
+                cursor_status,
+                cursor_created_at,
+                cursor_id,
+                len(results),
+                sent,
+                failed,
+                last_error,
+                _utc_now_iso(),
+                job_id,
+            ),
         )
         conn.commit()
     finally:
         conn.close()
 
 
+def get_stats_rollups(*, db_path: str, since: str, until: str) -> list[dict]:
+    """Return rollup rows with since <= bucket < until (ISO strings, UTC).
+
+    Reads only sms_stats_hourly, so cost is O(buckets), not O(messages).
+    """
+    conn = connect(db_path)
+    try:
+        rows = conn.execute(
+            """
+            SELECT bucket, dimension, value, count
+              FROM sms_stats_hourly
+             WHERE bucket >= ? AND bucket < ?
+             ORDER BY bucket, dimension, value
+            """,
+            (_hour_bucket(since), until),
+        ).fetchall()
+        return [dict(r) for r in rows]
+    finally:
+        conn.close()
+
+
 def create_user(*, db_path: str, username: str, email: str, password_hash: str) -> int:
     conn = connect(db_path)
     try:
@@ -1,14 +1,15 @@
 import hashlib
 import hmac
 import json
+import logging
 import os
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from uuid import uuid4
 from typing import Optional
 
 import httpx
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Request
 from pydantic import BaseModel, Field
 
 from passlib.context import CryptContext
@@ -16,6 +17,8 @@ from passlib.context import CryptContext
 from db import (
     create_api_token,
     create_user,
+    get_redelivery_job,
+    get_stats_rollups,
     get_user_by_identifier,
     get_user_by_token_hash,
     init_db,
@@ -23,9 +26,12 @@ from db import (
     try_insert_incoming,
     update_user_password_hash,
 )
+from redeliver import build_params, claim_job, run_redelivery
 
 load_dotenv()
 
+logger = logging.getLogger("message_reply")
+
 SECRET = os.getenv("SMS_BRIDGE_SECRET", "")
 BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
 CHAT_ID = os.getenv("TELEGRAM_CHAT_ID", "")
@@ -34,6 +40,9 @@ PORT = int(os.getenv("PORT", "3000"))
 # Auth
 AUTH_REQUIRED = os.getenv("AUTH_REQUIRED", "true").strip().lower() in ("1", "true", "yes", "y")
 ALLOW_SECRET_AUTH = os.getenv("ALLOW_SECRET_AUTH", "false").strip().lower() in ("1", "true", "yes", "y")
+# Admin endpoints (/stats, /admin/*): Bearer token whose username is in this comma-separated list.
+# Empty => admin endpoints are disabled (signup is open, so "any user" is not an admin).
+ADMIN_USERNAMES = {u.strip().lower() for u in os.getenv("ADMIN_USERNAMES", "").split(",") if u.strip()}
 
 # Password hashing
 # Prefer argon2 (no 72-byte password limitation like bcrypt). Keep bcrypt support for old hashes.
@@ -56,6 +65,9 @@ ALLOW_LEGACY_SECRET = os.getenv("ALLOW_LEGACY_SECRET", "true").strip().lower() i
 DB_PATH = os.getenv("DB_PATH", "./sms-bridge.sqlite3")
 DEDUP_WINDOW_SECONDS = int(os.getenv("DEDUP_WINDOW_SECONDS", "120"))
 
+# Stats (/stats reads hourly rollups; cap the window to keep responses small)
+STATS_MAX_HOURS = int(os.getenv("STATS_MAX_HOURS", str(24 * 31)))
+
 app = FastAPI(title="Message_reply: SMS → Telegram (v0.3)")
 
 
@@ -67,6 +79,16 @@ class IncomingSMS(BaseModel):
     receivedAt: Optional[str] = None  # ISO timestamp string (optional)
 
 
+class RedeliverRequest(BaseModel):
+    # ISO timestamps; created_at range [since, until). Defaults: last 24h.
+    since: Optional[str] = None
+    until: Optional[str] = None
+    statuses: Optional[list[str]] = None  # subset of ["telegram_error", "received"]
+    limit: Optional[int] = None
+    stuckMinutes: Optional[int] = None
+    jobId: Optional[str] = None  # resume an existing job
+
+
 class SignupRequest(BaseModel):
     username: str
     email: str
@@ -126,6 +148,34 @@ def _format_message(from_number: str, body: str, ts: str) -> tuple[str, Optional
     return text, None
 
 
+async def _send_telegram(
+    client: httpx.AsyncClient, from_number: str, body: str, ts: str
+) -> httpx.Response:
+    text, parse_mode = _format_message(from_number, body, ts)
+
+    url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
+    data = {
+        "chat_id": CHAT_ID,
+        "text": text,
+        "disable_web_page_preview": True,
+    }
+    if parse_mode:
+        data["parse_mode"] = parse_mode
+
+    return await client.post(url, data=data)
+
+
+def _parse_telegram_response(r: httpx.Response) -> tuple[Optional[int], Optional[str]]:
+    """Returns (telegram_message_id, telegram_error)."""
+    if r.status_code != 200:
+        return None, r.text
+    try:
+        j = r.json()
+        return (int(j.get("result", {}).get("message_id")) if j.get("ok") else None), None
+    except Exception:
+        return None, None
+
+
 def _verify_hmac_headers(*, request: Request, raw_body: bytes) -> bool:
     """Return True if HMAC auth passes, False if headers missing.
 
@@ -185,6 +235,13 @@ def _require_user(request: Request):
     return user
 
 
+def _require_admin(request: Request):
+    user = _require_user(request)
+    if str(user["username"]).lower() not in ADMIN_USERNAMES:
+        raise HTTPException(status_code=403, detail="Admin only")
+    return user
+
+
 def _compute_fingerprint(from_number: str, body: str, received_at: Optional[str]) -> str:
     # Goal: suppress duplicates caused by retries/multipart within a short window.
     # We bucket by time window to tolerate small timestamp differences.
@@ -223,6 +280,121 @@ def health():
     }
 
 
+@app.get("/stats")
+def stats(request: Request, hours: int = 24, top: int = 10):
+    """Dashboard counters for the last `hours` hours, read only from sms_stats_hourly."""
+    _require_admin(request)
+
+    hours = max(1, min(hours, STATS_MAX_HOURS))
+    top = max(0, min(top, 100))
+
+    now = datetime.now(timezone.utc)
+    until = (now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)).isoformat(timespec="seconds")
+    since = (now - timedelta(hours=hours - 1)).isoformat(timespec="seconds")
+
+    rows = get_stats_rollups(db_path=DB_PATH, since=since, until=until)
+
+    buckets: dict[str, dict] = {}
+    totals: dict[str, dict[str, int]] = {"event": {}, "status": {}}
+    senders: dict[str, int] = {}
+    for r in rows:
+        dim, value, count = r["dimension"], r["value"], int(r["count"])
+        if dim == "sender":
+            senders[value] = senders.get(value, 0) + count
+            continue
+        b = buckets.setdefault(r["bucket"], {"bucket": r["bucket"], "event": {}, "status": {}})
+        b.setdefault(dim, {})[value] = count
+        totals.setdefault(dim, {})
+        totals[dim][value] = totals[dim].get(value, 0) + count
+
+    incoming = totals["event"].get("incoming", 0)
+    duplicates = totals["event"].get("duplicate", 0)
+    # Error rate comes from append-only attempt events, so outages stay visible
+    # after redelivery moves the rows to 'sent'.
+    sent = totals["event"].get("telegram_sent", 0)
+    errors = totals["event"].get("telegram_error", 0)
+    top_senders = sorted(senders.items(), key=lambda kv: (-kv[1], kv[0]))[:top]
+
+    return {
+        "ok": True,
+        "since": since,
+        "until": until,
+        "totals": totals,
+        "duplicateRatio": duplicates / (incoming + duplicates) if (incoming + duplicates) else 0.0,
+        "telegramErrorRate": errors / (sent + errors) if (sent + errors) else 0.0,
+        "topSenders": [{"from": k, "count": v} for k, v in top_senders],
+        "buckets": [buckets[k] for k in sorted(buckets)],
+    }
+
+
+async def _run_redelivery_job(job_id: str) -> None:
+    try:
+        await run_redelivery(
+            db_path=DB_PATH,
+            job_id=job_id,
+            send=_send_telegram,
+            parse=_parse_telegram_response,
+            claimed=True,
+        )
+    except Exception:
+        logger.exception("Redelivery job %s failed", job_id)
+
+
+@app.post("/admin/redeliver")
+def admin_redeliver(request: Request, req: RedeliverRequest, background_tasks: BackgroundTasks):
+    """Start (or resume) a bulk redelivery job in the background. Returns its job id.
+
+    Only one job runs at a time (across the server and CLI); otherwise 409.
+    """
+    _require_admin(request)
+    if not BOT_TOKEN or not CHAT_ID:
+        raise HTTPException(status_code=500, detail="Server not configured. Create .env from .env.example")
+
+    job = get_redelivery_job(db_path=DB_PATH, job_id=req.jobId) if req.jobId else None
+    if job:
+        # A resumed job always uses its stored params; don't silently drop new ones.
+        overrides = req.model_dump(exclude={"jobId"}, exclude_none=True)
+        if overrides:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Job {job['job_id']} exists; cannot change {sorted(overrides)} when resuming",
+            )
+        params = json.loads(job["params"])
+        if job["state"] == "done":
+            return {"ok": True, "jobId": job["job_id"], "state": "done", "params": params}
+        # Claim in the DB before scheduling so concurrent POSTs / CLI runs can't both start.
+        claimed = claim_job(db_path=DB_PATH, job_id=job["job_id"])
+    else:
+        now = datetime.now(timezone.utc)
+        try:
+            params = build_params(
+                since=req.since or (now - timedelta(hours=24)).isoformat(timespec="seconds"),
+                until=req.until or now.isoformat(timespec="seconds"),
+                statuses=req.statuses,
+                limit=req.limit,
+                stuck_minutes=req.stuckMinutes,
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        job = {"job_id": req.jobId or uuid4().hex[:12]}
+        claimed = claim_job(db_path=DB_PATH, job_id=job["job_id"], params=params)
+    if not claimed:
+        raise HTTPException(status_code=409, detail="A redelivery job is already running")
+
+    background_tasks.add_task(_run_redelivery_job, job["job_id"])
+    return {"ok": True, "jobId": job["job_id"], "state": "running", "params": params}
+
+
+@app.get("/admin/redeliver/{job_id}")
+def admin_redeliver_status(request: Request, job_id: str):
+    _require_admin(request)
+    job = get_redelivery_job(db_path=DB_PATH, job_id=job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    job["params"] = json.loads(job["params"])
+    return {"ok": True, "job": job}
+
+
 @app.post("/auth/signup")
 def auth_signup(req: SignupRequest):
     if not req.username.strip() or not req.email.strip() or not req.password:
@@ -326,30 +498,10 @@ async def sms_incoming(request: Request, payload: IncomingSMS):
         return {"ok": True, "duplicate": True, "id": row_id}
 
     ts = payload.receivedAt or datetime.now(timezone.utc).isoformat(timespec="seconds")
-    text, parse_mode = _format_message(payload.from_number, payload.body, ts)
-
-    url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
-    data = {
-        "chat_id": CHAT_ID,
-        "text": text,
-        "disable_web_page_preview": True,
-    }
-    if parse_mode:
-        data["parse_mode"] = parse_mode
-
-    telegram_message_id: Optional[int] = None
-    telegram_error: Optional[str] = None
 
     async with httpx.AsyncClient(timeout=10) as client:
-        r = await client.post(url, data=data)
-        if r.status_code != 200:
-            telegram_error = r.text
-        else:
-            try:
-                j = r.json()
-                telegram_message_id = int(j.get("result", {}).get("message_id")) if j.get("ok") else None
-            except Exception:
-                telegram_message_id = None
+        r = await _send_telegram(client, payload.from_number, payload.body, ts)
+    telegram_message_id, telegram_error = _parse_telegram_response(r)
 
     mark_telegram_result(
         db_path=DB_PATH,
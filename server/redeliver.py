@@ -0,0 +1,345 @@
+"""Bulk redelivery of failed/stuck messages to Telegram.
+
+Selects rows with status 'telegram_error' (and 'received' rows older than a
+"stuck" threshold) by created_at range, resends them concurrently within a
+rate limit, and writes results + a keyset checkpoint in batches. Jobs are
+resumable by job id.
+
+Usage (from server/):
+    python redeliver.py --since 2026-10-19T00:00:00Z --until 2026-10-19T06:00:00Z
+    python redeliver.py --job <job_id>        # resume an interrupted job
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Optional
+from uuid import uuid4
+
+import httpx
+from dotenv import load_dotenv
+
+from db import (
+    apply_redelivery_batch,
+    claim_redelivery_job,
+    create_redelivery_job,
+    get_redelivery_job,
+    select_redelivery_candidates,
+    set_redelivery_job_state,
+)
+
+# Settings below are read at import time; main imports this module before its own load_dotenv().
+load_dotenv()
+
+# Telegram allows roughly 1 msg/s per chat (bursts are throttled with 429 + retry_after).
+REDELIVERY_RATE_PER_SECOND = float(os.getenv("REDELIVERY_RATE_PER_SECOND", "1"))
+REDELIVERY_CONCURRENCY = int(os.getenv("REDELIVERY_CONCURRENCY", "4"))
+REDELIVERY_BATCH_SIZE = int(os.getenv("REDELIVERY_BATCH_SIZE", "50"))
+REDELIVERY_MAX_ROWS = int(os.getenv("REDELIVERY_MAX_ROWS", "5000"))
+# 'received' rows younger than this may still be in flight on /sms/incoming.
+REDELIVERY_STUCK_MINUTES = int(os.getenv("REDELIVERY_STUCK_MINUTES", "10"))
+# A 'running' job with no checkpoint for this long is presumed dead (e.g. killed process).
+# Must exceed the time to send one batch (batch size / rate, plus 429 back-off).
+REDELIVERY_STALE_MINUTES = int(os.getenv("REDELIVERY_STALE_MINUTES", "10"))
+
+# Processing order matters for the checkpoint: cursor_status indexes into this.
+REDELIVERABLE_STATUSES = ("telegram_error", "received")
+
+MAX_429_RETRIES = 3
+
+SendFn = Callable[[httpx.AsyncClient, str, str, str], Awaitable[httpx.Response]]
+ParseFn = Callable[[httpx.Response], tuple[Optional[int], Optional[str]]]
+
+def claim_job(*, db_path: str, job_id: str, params: Optional[dict] = None) -> bool:
+    """Mark job_id 'running' in the DB, creating it from params if given.
+
+    Returns False if any job (in any process) is already running. Overlapping jobs
+    would resend the same rows and duplicate Telegram messages.
+    """
+    stale_before = (datetime.now(timezone.utc) - timedelta(minutes=REDELIVERY_STALE_MINUTES)).isoformat(
+        timespec="seconds"
+    )
+    return claim_redelivery_job(
+        db_path=db_path,
+        job_id=job_id,
+        stale_before=stale_before,
+        params=json.dumps(params, sort_keys=True) if params is not None else None,
+    )
+
+
+def normalize_iso(value: str) -> str:
+    """Parse an ISO timestamp (tolerating trailing Z) and return UTC in the DB's format."""
+    dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc).isoformat(timespec="seconds")
+
+
+def build_params(
+    *,
+    since: str,
+    until: str,
+    statuses: Optional[list[str]] = None,
+    limit: Optional[int] = None,
+    stuck_minutes: Optional[int] = None,
+) -> dict:
+    """Validate/normalize job parameters. Raises ValueError on bad input."""
+    statuses = list(statuses or REDELIVERABLE_STATUSES)
+    unknown = [s for s in statuses if s not in REDELIVERABLE_STATUSES]
+    if unknown:
+        raise ValueError(f"Unsupported statuses: {unknown}")
+    since_iso = normalize_iso(since)
+    until_iso = normalize_iso(until)
+    if since_iso >= until_iso:
+        raise ValueError("since must be before until")
+    stuck = REDELIVERY_STUCK_MINUTES if stuck_minutes is None else max(0, stuck_minutes)
+    stuck_before = (datetime.now(timezone.utc) - timedelta(minutes=stuck)).isoformat(timespec="seconds")
+    return {
+        "since": since_iso,
+        "until": until_iso,
+        "statuses": [s for s in REDELIVERABLE_STATUSES if s in statuses],
+        "limit": max(1, min(limit or REDELIVERY_MAX_ROWS, REDELIVERY_MAX_ROWS)),
+        "stuck_before": stuck_before,
+    }
+
+
+def new_job(*, db_path: str, params: dict, job_id: Optional[str] = None) -> str:
+    job_id = job_id or uuid4().hex[:12]
+    create_redelivery_job(db_path=db_path, job_id=job_id, params=json.dumps(params, sort_keys=True))
+    return job_id
+
+
+class _RateLimiter:
+    """Spaces calls at least 1/rate seconds apart; 429s push the next slot back."""
+
+    def __init__(self, rate_per_second: float):
+        self._interval = 1.0 / rate_per_second if rate_per_second > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        async with self._lock:
+            delay = self._next - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next = max(self._next, time.monotonic()) + self._interval
+
+    def pause(self, seconds: float) -> None:
+        self._next = max(self._next, time.monotonic() + seconds)
+
+
+def _retry_after(r: httpx.Response) -> float:
+    try:
+        return float(r.json().get("parameters", {}).get("retry_after", 1))
+    except Exception:
+        return 1.0
+
+
+async def _deliver(
+    *,
+    client: httpx.AsyncClient,
+    row: dict,
+    send: SendFn,
+    parse: ParseFn,
+    limiter: _RateLimiter,
+    sem: asyncio.Semaphore,
+) -> tuple[int, Optional[int], Optional[str]]:
+    ts = row["received_at"] or row["created_at"]
+    async with sem:
+        for _ in range(MAX_429_RETRIES + 1):
+            await limiter.wait()
+            try:
+                r = await send(client, row["from_number"], row["body"], ts)
+            except httpx.HTTPError as e:
+                return row["id"], None, f"{type(e).__name__}: {e}"
+            if r.status_code == 429:
+                limiter.pause(_retry_after(r))
+                continue
+            telegram_message_id, telegram_error = parse(r)
+            return row["id"], telegram_message_id, telegram_error
+        return row["id"], None, r.text
+
+
+async def run_redelivery(
+    *,
+    db_path: str,
+    job_id: str,
+    send: SendFn,
+    parse: ParseFn,
+    concurrency: int = REDELIVERY_CONCURRENCY,
+    rate_per_second: float = REDELIVERY_RATE_PER_SECOND,
+    batch_size: int = REDELIVERY_BATCH_SIZE,
+    claimed: bool = False,
+) -> dict:
+    """Run (or resume) a redelivery job to completion. Returns the final job row.
+
+    Pass claimed=True if the caller already holds the job via claim_job().
+    """
+    job = get_redelivery_job(db_path=db_path, job_id=job_id)
+    if not job:
+        raise ValueError(f"Unknown job: {job_id}")
+    if job["state"] == "done":
+        return job
+    if not claimed:
+        if not claim_job(db_path=db_path, job_id=job_id):
+            raise RuntimeError("Another redelivery job is running")
+        job = get_redelivery_job(db_path=db_path, job_id=job_id)
+    return await _run_job(
+        db_path=db_path,
+        job=job,
+        send=send,
+        parse=parse,
+        concurrency=concurrency,
+        rate_per_second=rate_per_second,
+        batch_size=batch_size,
+    )
+
+
+async def _run_job(
+    *,
+    db_path: str,
+    job: dict,
+    send: SendFn,
+    parse: ParseFn,
+    concurrency: int,
+    rate_per_second: float,
+    batch_size: int,
+) -> dict:
+    job_id = job["job_id"]
+    # The job is already claimed ('running'); every exit path below must release it.
+    try:
+        params = json.loads(job["params"])
+        statuses: list[str] = params["statuses"]
+        remaining = params["limit"] - int(job["attempted"])
+
+        # Resume from checkpoint: skip statuses already finished.
+        start = statuses.index(job["cursor_status"]) if job["cursor_status"] in statuses else 0
+        cursor_created_at: Optional[str] = job["cursor_created_at"]
+        cursor_id: Optional[int] = job["cursor_id"]
+
+        limiter = _RateLimiter(rate_per_second)
+        sem = asyncio.Semaphore(max(1, concurrency))
+        async with httpx.AsyncClient(timeout=10) as client:
+            for i, status in enumerate(statuses[start:], start=start):
+                if i > start:
+                    cursor_created_at, cursor_id = None, None
+                # Only treat 'received' rows as stuck once they are old enough.
+                until = params["until"]
+                if status == "received":
+                    until = min(until, params["stuck_before"])
+
+                while remaining > 0:
+                    rows = select_redelivery_candidates(
+                        db_path=db_path,
+                        status=status,
+                        since=params["since"],
+                        until=until,
+                        after_created_at=cursor_created_at,
+                        after_id=cursor_id,
+                        limit=min(batch_size, remaining),
+                    )
+                    if not rows:
+                        break
+
+                    results = await asyncio.gather(
+                        *(
+                            _deliver(client=client, row=row, send=send, parse=parse, limiter=limiter, sem=sem)
+                            for row in rows
+                        )
+                    )
+                    cursor_created_at, cursor_id = rows[-1]["created_at"], rows[-1]["id"]
+                    apply_redelivery_batch(
+                        db_path=db_path,
+                        job_id=job_id,
+                        results=list(results),
+                        cursor_status=status,
+                        cursor_created_at=cursor_created_at,
+                        cursor_id=cursor_id,
+                    )
+                    remaining -= len(rows)
+
+        set_redelivery_job_state(db_path=db_path, job_id=job_id, state="done")
+    except BaseException as e:
+        # Includes cancellation/Ctrl-C, so an interrupted job doesn't hold the claim until it goes stale.
+        set_redelivery_job_state(db_path=db_path, job_id=job_id, state="failed", last_error=repr(e))
+        raise
+
+    return get_redelivery_job(db_path=db_path, job_id=job_id)
+
+
+def cli() -> None:
+    # Imported lazily: main imports this module for the admin endpoint.
+    import main as server
+
+    parser = argparse.ArgumentParser(description="Redeliver failed/stuck SMS rows to Telegram.")
+    parser.add_argument("--job", help="Job id to resume (or to assign to a new job)")
+    parser.add_argument("--since", help="ISO start of created_at range (default: 24h ago)")
+    parser.add_argument("--until", help="ISO end of created_at range, exclusive (default: now)")
+    parser.add_argument(
+        "--status",
+        action="append",
+        choices=REDELIVERABLE_STATUSES,
+        help="Status to redeliver (repeatable; default: all)",
+    )
+    parser.add_argument("--limit", type=int, help=f"Max rows to attempt (cap {REDELIVERY_MAX_ROWS})")
+    parser.add_argument("--stuck-minutes", type=int, help="Min age for 'received' rows to count as stuck")
+    args = parser.parse_args()
+
+    if not server.BOT_TOKEN or not server.CHAT_ID:
+        parser.error("Server not configured. Create .env from .env.example")
+
+    server.init_db(server.DB_PATH)
+
+    job = get_redelivery_job(db_path=server.DB_PATH, job_id=args.job) if args.job else None
+    if job:
+        overrides = [
+            f"--{name.replace('_', '-')}"
+            for name in ("since", "until", "status", "limit", "stuck_minutes")
+            if getattr(args, name) is not None
+        ]
+        if overrides:
+            parser.error(f"job {args.job} exists; {', '.join(overrides)} cannot be changed when resuming")
+        job_id = job["job_id"]
+        print(
+            f"Resuming job {job_id} (state={job['state']}, attempted={job['attempted']}): {job['params']}"
+        )
+    else:
+        now = datetime.now(timezone.utc)
+        try:
+            params = build_params(
+                since=args.since or (now - timedelta(hours=24)).isoformat(timespec="seconds"),
+                until=args.until or now.isoformat(timespec="seconds"),
+                statuses=args.status,
+                limit=args.limit,
+                stuck_minutes=args.stuck_minutes,
+            )
+        except ValueError as e:
+            parser.error(str(e))
+        job_id = args.job or uuid4().hex[:12]
+        if not claim_job(db_path=server.DB_PATH, job_id=job_id, params=params):
+            parser.error("Another redelivery job is running")
+        print(f"Started job {job_id}: {json.dumps(params)}")
+
+    try:
+        result = asyncio.run(
+            run_redelivery(
+                db_path=server.DB_PATH,
+                job_id=job_id,
+                send=server._send_telegram,
+                parse=server._parse_telegram_response,
+                claimed=not job,
+            )
+        )
+    except RuntimeError as e:
+        parser.error(str(e))
+    print(
+        f"Job {job_id} {result['state']}: attempted={result['attempted']} "
+        f"sent={result['sent']} failed={result['failed']}"
+    )
+
+
+if __name__ == "__main__":
+    cli()
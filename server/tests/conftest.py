@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Server modules are imported flat (e.g. `from db import ...`), as uvicorn does from server/.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
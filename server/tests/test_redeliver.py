@@ -0,0 +1,288 @@
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import db
+import main
+import redeliver
+
+
+def _iso(dt: datetime) -> str:
+    return dt.isoformat(timespec="seconds")
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "sms.sqlite3")
+    db.init_db(path)
+    return path
+
+
+def _seed(db_path: str, bodies: list[str], *, failed: bool, at: Optional[datetime] = None) -> list[int]:
+    """Insert rows through the normal write path with db's clock pinned to `at`.
+
+    Defaults to 5 minutes ago, so 'received' rows count as stuck (created_at < stuck_before)
+    and rows + rollups agree on the hour bucket.
+    """
+    at = at or datetime.now(timezone.utc) - timedelta(minutes=5)
+    ids = []
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(db, "_utc_now_iso", lambda: _iso(at))
+        for body in bodies:
+            _, row_id = db.try_insert_incoming(
+                db_path=db_path,
+                fingerprint=body,
+                from_number="+1",
+                body=body,
+                received_at=None,
+                auth_method="bearer",
+                request_id=None,
+            )
+            if failed:
+                db.mark_telegram_result(
+                    db_path=db_path, row_id=row_id, telegram_message_id=None, telegram_error="down"
+                )
+            ids.append(row_id)
+    return ids
+
+
+def _new_job(db_path: str, **kwargs) -> str:
+    now = datetime.now(timezone.utc)
+    params = redeliver.build_params(
+        since=_iso(now - timedelta(hours=3)),
+        until=_iso(now + timedelta(minutes=1)),
+        stuck_minutes=0,
+        **kwargs,
+    )
+    return redeliver.new_job(db_path=db_path, params=params)
+
+
+class FakeTelegram:
+    """Injected `send`: records bodies and answers per-body scripted responses."""
+
+    def __init__(self, script=None):
+        self.calls: list[str] = []
+        self.script = script or {}
+
+    async def send(self, client, from_number, body, ts):
+        self.calls.append(body)
+        request = httpx.Request("POST", "https://api.telegram.org/sendMessage")
+        action = self.script.get(body)
+        if callable(action):
+            action = action(self.calls.count(body))
+        if isinstance(action, Exception):
+            raise action
+        if action == 429:
+            return httpx.Response(429, json={"ok": False, "parameters": {"retry_after": 0.01}}, request=request)
+        if action == 400:
+            return httpx.Response(400, text="Bad Request", request=request)
+        return httpx.Response(200, json={"ok": True, "result": {"message_id": len(self.calls)}}, request=request)
+
+
+def _parse(r: httpx.Response):
+    if r.status_code != 200:
+        return None, r.text
+    return int(r.json()["result"]["message_id"]), None
+
+
+def _run(db_path: str, job_id: str, fake: FakeTelegram, **kwargs) -> dict:
+    return asyncio.run(
+        redeliver.run_redelivery(
+            db_path=db_path,
+            job_id=job_id,
+            send=fake.send,
+            parse=_parse,
+            rate_per_second=0,
+            **kwargs,
+        )
+    )
+
+
+def _statuses(db_path: str) -> dict[str, str]:
+    conn = db.connect(db_path)
+    try:
+        return {r["body"]: r["status"] for r in conn.execute("SELECT body, status FROM sms_messages")}
+    finally:
+        conn.close()
+
+
+def test_redelivers_errors_then_stuck_rows(db_path):
+    _seed(db_path, ["e1", "e2", "e3"], failed=True)
+    _seed(db_path, ["r1", "r2"], failed=False)
+    # e2 is throttled once, e3 is rejected outright.
+    fake = FakeTelegram({"e2": lambda n: 429 if n == 1 else 200, "e3": 400})
+
+    job = _run(db_path, _new_job(db_path), fake, batch_size=2)
+
+    assert job["state"] == "done"
+    assert (job["attempted"], job["sent"], job["failed"]) == (5, 4, 1)
+    assert job["cursor_status"] == "received"
+    assert fake.calls == ["e1", "e2", "e2", "e3", "r1", "r2"]
+    assert _statuses(db_path) == {"e1": "sent", "e2": "sent", "e3": "telegram_error", "r1": "sent", "r2": "sent"}
+
+
+def test_respects_limit_and_status_filter(db_path):
+    _seed(db_path, ["e1", "e2"], failed=True)
+    _seed(db_path, ["r1"], failed=False)
+    fake = FakeTelegram()
+
+    job = _run(db_path, _new_job(db_path, statuses=["received"], limit=5), fake)
+    assert fake.calls == ["r1"]
+    assert job["attempted"] == 1
+
+    fake = FakeTelegram()
+    job = _run(db_path, _new_job(db_path, limit=1), fake)
+    assert fake.calls == ["e1"]
+    assert job["attempted"] == 1
+
+
+def test_resumes_from_checkpoint_after_interrupt(db_path):
+    _seed(db_path, ["e1", "e2", "e3", "e4", "e5"], failed=True)
+    job_id = _new_job(db_path)
+
+    # Crash in the second batch: the first batch is checkpointed, the second is not.
+    crashing = FakeTelegram({"e4": RuntimeError("process killed")})
+    with pytest.raises(RuntimeError):
+        _run(db_path, job_id, crashing, batch_size=2, concurrency=1)
+
+    job = db.get_redelivery_job(db_path=db_path, job_id=job_id)
+    assert job["state"] == "failed"
+    assert (job["attempted"], job["cursor_status"]) == (2, "telegram_error")
+    assert _statuses(db_path)["e2"] == "sent"
+    assert _statuses(db_path)["e3"] == "telegram_error"
+
+    fake = FakeTelegram()
+    job = _run(db_path, job_id, fake, batch_size=2)
+
+    assert fake.calls == ["e3", "e4", "e5"]
+    assert job["state"] == "done"
+    assert (job["attempted"], job["sent"]) == (5, 5)
+    assert set(_statuses(db_path).values()) == {"sent"}
+
+    # A finished job is a no-op when run again.
+    fake = FakeTelegram()
+    assert _run(db_path, job_id, fake)["state"] == "done"
+    assert fake.calls == []
+
+
+def test_rejects_second_job_while_one_is_running(db_path):
+    _seed(db_path, ["e1"], failed=True)
+    job_id = _new_job(db_path)
+    # Another process holds a claim: it lives in the DB, not in this process.
+    assert redeliver.claim_job(db_path=db_path, job_id=_new_job(db_path))
+    fake = FakeTelegram()
+
+    with pytest.raises(RuntimeError):
+        _run(db_path, job_id, fake)
+    assert not redeliver.claim_job(db_path=db_path, job_id=job_id)
+    assert fake.calls == []
+    assert db.get_redelivery_job(db_path=db_path, job_id=job_id)["state"] == "pending"
+
+
+def test_stale_running_job_is_released(db_path):
+    _seed(db_path, ["e1"], failed=True)
+    dead = _new_job(db_path)
+    assert redeliver.claim_job(db_path=db_path, job_id=dead)
+    conn = db.connect(db_path)
+    try:
+        stale = datetime.now(timezone.utc) - timedelta(minutes=redeliver.REDELIVERY_STALE_MINUTES + 1)
+        conn.execute("UPDATE redelivery_jobs SET updated_at = ? WHERE job_id = ?", (_iso(stale), dead))
+        conn.commit()
+    finally:
+        conn.close()
+
+    fake = FakeTelegram()
+    job = _run(db_path, _new_job(db_path), fake)
+
+    assert job["state"] == "done"
+    assert fake.calls == ["e1"]
+    dead_job = db.get_redelivery_job(db_path=db_path, job_id=dead)
+    assert dead_job["state"] == "failed"
+    assert dead_job["last_error"].startswith("stale")
+
+
+def test_claim_releases_after_failure(db_path):
+    _seed(db_path, ["e1"], failed=True)
+    job_id = _new_job(db_path)
+    with pytest.raises(RuntimeError):
+        _run(db_path, job_id, FakeTelegram({"e1": RuntimeError("boom")}))
+
+    assert db.get_redelivery_job(db_path=db_path, job_id=job_id)["state"] == "failed"
+    assert redeliver.claim_job(db_path=db_path, job_id=_new_job(db_path))
+
+
+def test_rollups_keep_error_events_after_redelivery(db_path):
+    seeded_hour = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0) - timedelta(hours=2)
+    _seed(db_path, ["e1", "e2"], failed=True, at=seeded_hour + timedelta(minutes=30))
+    attempt_hour = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    _run(db_path, _new_job(db_path), FakeTelegram())
+
+    rows = db.get_stats_rollups(
+        db_path=db_path, since=_iso(seeded_hour), until=_iso(attempt_hour + timedelta(hours=1))
+    )
+    counts = {(r["bucket"], r["dimension"], r["value"]): r["count"] for r in rows if r["count"]}
+
+    seeded, attempted = _iso(seeded_hour), _iso(attempt_hour)
+    assert counts == {
+        (seeded, "event", "incoming"): 2,
+        (seeded, "sender", "+1"): 2,
+        # The outage stays recorded in its own hour...
+        (seeded, "event", "telegram_error"): 2,
+        # ...while current status moves within the rows' own bucket.
+        (seeded, "status", "sent"): 2,
+        (attempted, "event", "telegram_sent"): 2,
+    }
+
+
+@pytest.fixture
+def admin_client(db_path, monkeypatch):
+    monkeypatch.setattr(main, "DB_PATH", db_path)
+    monkeypatch.setattr(main, "ADMIN_USERNAMES", {"admin"})
+    monkeypatch.setattr(main, "BOT_TOKEN", "test-token")
+    monkeypatch.setattr(main, "CHAT_ID", "1")
+    user_id = db.create_user(db_path=db_path, username="admin", email="admin@example.com", password_hash="x")
+    db.create_api_token(db_path=db_path, user_id=user_id, token_hash=main._hash_token("admin-token"))
+    client = TestClient(main.app)
+    client.headers["Authorization"] = "Bearer admin-token"
+    return client
+
+
+def test_admin_redeliver_endpoint(admin_client, db_path, monkeypatch):
+    _seed(db_path, ["e1"], failed=True)
+    fake = FakeTelegram()
+    monkeypatch.setattr(main, "_send_telegram", fake.send)
+    window = {"since": _iso(datetime.now(timezone.utc) - timedelta(hours=1)), "stuckMinutes": 0}
+
+    # A job claimed elsewhere (e.g. the CLI) blocks new ones.
+    other = _new_job(db_path)
+    assert redeliver.claim_job(db_path=db_path, job_id=other)
+    assert admin_client.post("/admin/redeliver", json=window).status_code == 409
+    db.set_redelivery_job_state(db_path=db_path, job_id=other, state="failed")
+
+    # TestClient runs the background task before returning.
+    r = admin_client.post("/admin/redeliver", json=window)
+    assert r.status_code == 200
+    job_id = r.json()["jobId"]
+    assert fake.calls == ["e1"]
+
+    job = admin_client.get(f"/admin/redeliver/{job_id}").json()["job"]
+    assert (job["state"], job["sent"]) == ("done", 1)
+
+
+def test_admin_redeliver_rejects_params_when_resuming(admin_client, db_path, monkeypatch):
+    _seed(db_path, ["e1"], failed=True)
+    monkeypatch.setattr(main, "_send_telegram", FakeTelegram().send)
+    job_id = _new_job(db_path)
+
+    r = admin_client.post("/admin/redeliver", json={"jobId": job_id, "limit": 1})
+    assert r.status_code == 400
+    assert db.get_redelivery_job(db_path=db_path, job_id=job_id)["state"] == "pending"
+
+    r = admin_client.post("/admin/redeliver", json={"jobId": job_id})
+    assert r.status_code == 200
+    assert r.json()["params"] == json.loads(db.get_redelivery_job(db_path=db_path, job_id=job_id)["params"])
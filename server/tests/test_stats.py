@@ -0,0 +1,180 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+import db
+import main
+
+
+def _iso(dt: datetime) -> str:
+    return dt.isoformat(timespec="seconds")
+
+
+CURRENT_HOUR = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+OLD_HOUR = CURRENT_HOUR - timedelta(hours=2)
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "sms.sqlite3")
+    db.init_db(path)
+    return path
+
+
+@pytest.fixture
+def at(monkeypatch):
+    """Pin db's clock, so rows and rollups land in a known hour bucket."""
+
+    def _set(dt: datetime) -> None:
+        monkeypatch.setattr(db, "_utc_now_iso", lambda: _iso(dt))
+
+    return _set
+
+
+def _incoming(db_path: str, from_number: str, body: str) -> tuple[bool, int]:
+    return db.try_insert_incoming(
+        db_path=db_path,
+        fingerprint=f"{from_number}:{body}",
+        from_number=from_number,
+        body=body,
+        received_at=None,
+        auth_method="bearer",
+        request_id=None,
+    )
+
+
+def _rollups(db_path: str) -> dict[tuple[str, str, str], int]:
+    rows = db.get_stats_rollups(db_path=db_path, since=_iso(OLD_HOUR), until=_iso(CURRENT_HOUR + timedelta(hours=1)))
+    return {(r["bucket"], r["dimension"], r["value"]): r["count"] for r in rows if r["count"]}
+
+
+def test_rollups_track_inserts_duplicates_and_status_moves(db_path, at):
+    old, cur = _iso(OLD_HOUR), _iso(CURRENT_HOUR)
+
+    at(OLD_HOUR)
+    _, a = _incoming(db_path, "+1", "a")
+    _, b = _incoming(db_path, "+2", "b")
+    assert _incoming(db_path, "+1", "a") == (False, a)
+    db.mark_telegram_result(db_path=db_path, row_id=b, telegram_message_id=None, telegram_error="down")
+
+    # Later attempts: events land in the attempt hour, status stays in the row's hour.
+    at(CURRENT_HOUR)
+    db.mark_telegram_result(db_path=db_path, row_id=a, telegram_message_id=1, telegram_error=None)
+    db.mark_telegram_result(db_path=db_path, row_id=b, telegram_message_id=2, telegram_error=None)
+    db.mark_telegram_result(db_path=db_path, row_id=999, telegram_message_id=3, telegram_error=None)
+
+    assert _rollups(db_path) == {
+        (old, "event", "incoming"): 2,
+        (old, "event", "duplicate"): 1,
+        (old, "event", "telegram_error"): 1,
+        (old, "sender", "+1"): 1,
+        (old, "sender", "+2"): 1,
+        (old, "status", "sent"): 2,
+        (cur, "event", "telegram_sent"): 2,
+    }
+
+
+def test_v3_backfills_rollups_for_existing_rows(db_path):
+    # Rewind to a pre-v3 DB that already has messages.
+    conn = db.connect(db_path)
+    try:
+        conn.execute("DELETE FROM schema_migrations WHERE version >= 3")
+        conn.execute("DROP TABLE sms_stats_hourly")
+        rows = [
+            ("f1", "+1", OLD_HOUR + timedelta(minutes=5), "sent"),
+            ("f2", "+1", OLD_HOUR + timedelta(minutes=50), "telegram_error"),
+            ("f3", "+2", CURRENT_HOUR, "received"),
+        ]
+        for fingerprint, from_number, created_at, status in rows:
+            conn.execute(
+                """
+                INSERT INTO sms_messages (fingerprint, from_number, body, created_at, status)
+                VALUES (?, ?, 'x', ?, ?)
+                """,
+                (fingerprint, from_number, _iso(created_at), status),
+            )
+        conn.commit()
+    finally:
+        conn.close()
+
+    db.init_db(db_path)
+
+    old, cur = _iso(OLD_HOUR), _iso(CURRENT_HOUR)
+    assert _rollups(db_path) == {
+        (old, "event", "incoming"): 2,
+        (old, "event", "telegram_sent"): 1,
+        (old, "event", "telegram_error"): 1,
+        (old, "status", "sent"): 1,
+        (old, "status", "telegram_error"): 1,
+        (old, "sender", "+1"): 2,
+        (cur, "event", "incoming"): 1,
+        (cur, "status", "received"): 1,
+        (cur, "sender", "+2"): 1,
+    }
+
+
+@pytest.fixture
+def client(db_path, monkeypatch):
+    monkeypatch.setattr(main, "DB_PATH", db_path)
+    monkeypatch.setattr(main, "ADMIN_USERNAMES", {"admin"})
+    return TestClient(main.app)
+
+
+def _token(db_path: str, username: str) -> str:
+    user_id = db.create_user(db_path=db_path, username=username, email=f"{username}@example.com", password_hash="x")
+    token = f"token-{username}"
+    db.create_api_token(db_path=db_path, user_id=user_id, token_hash=main._hash_token(token))
+    return token
+
+
+def test_stats_requires_admin(client, db_path):
+    assert client.get("/stats").status_code == 401
+    headers = {"Authorization": f"Bearer {_token(db_path, 'stranger')}"}
+    assert client.get("/stats", headers=headers).status_code == 403
+
+
+def test_stats_aggregates_rollups(client, db_path, at):
+    headers = {"Authorization": f"Bearer {_token(db_path, 'admin')}"}
+
+    at(OLD_HOUR)
+    _incoming(db_path, "+9", "old")
+
+    at(CURRENT_HOUR)
+    ids = [_incoming(db_path, n, b)[1] for n, b in [("+2", "a"), ("+2", "b"), ("+1", "c"), ("+3", "d")]]
+    _incoming(db_path, "+2", "a")  # duplicate
+    for row_id in ids[:3]:
+        db.mark_telegram_result(db_path=db_path, row_id=row_id, telegram_message_id=1, telegram_error=None)
+    db.mark_telegram_result(db_path=db_path, row_id=ids[3], telegram_message_id=None, telegram_error="down")
+
+    body = client.get("/stats", params={"hours": 1, "top": 2}, headers=headers).json()
+
+    assert body["duplicateRatio"] == pytest.approx(1 / 5)
+    assert body["telegramErrorRate"] == pytest.approx(1 / 4)
+    assert body["topSenders"] == [{"from": "+2", "count": 2}, {"from": "+1", "count": 1}]
+    assert [b["bucket"] for b in body["buckets"]] == [_iso(CURRENT_HOUR)]
+    assert body["buckets"][0]["status"] == {"received": 0, "sent": 3, "telegram_error": 1}
+
+    # A wider window includes the older bucket and its sender.
+    body = client.get("/stats", params={"hours": 3, "top": 10}, headers=headers).json()
+    assert [b["bucket"] for b in body["buckets"]] == [_iso(OLD_HOUR), _iso(CURRENT_HOUR)]
+    assert {"from": "+9", "count": 1} in body["topSenders"]
+    assert body["totals"]["event"]["incoming"] == 5
+
+
+def test_stats_clamps_hours_and_top(client, db_path, at, monkeypatch):
+    headers = {"Authorization": f"Bearer {_token(db_path, 'admin')}"}
+    monkeypatch.setattr(main, "STATS_MAX_HOURS", 2)
+    at(OLD_HOUR)
+    _incoming(db_path, "+9", "old")
+    at(CURRENT_HOUR)
+    _incoming(db_path, "+1", "new")
+
+    # hours is capped at STATS_MAX_HOURS=2, which excludes OLD_HOUR (2h ago).
+    body = client.get("/stats", params={"hours": 1000, "top": -5}, headers=headers).json()
+    assert [b["bucket"] for b in body["buckets"]] == [_iso(CURRENT_HOUR)]
+    assert body["topSenders"] == []
+
+    # hours below 1 still covers the current hour.
+    body = client.get("/stats", params={"hours": 0}, headers=headers).json()
+    assert [b["bucket"] for b in body["buckets"]] == [_iso(CURRENT_HOUR)]